@@ -1,25 +1,365 @@
+import os
 import sys
-import socket
 import hashlib
 import json
-from textwrap import dedent
-from time import time
+import math
+import gzip
+import threading
+import itertools
+import functools
+from time import time, perf_counter, sleep
 from urllib.parse import urlparse
-from uuid import uuid4
-import requests
-from flask import Flask, jsonify, request
 import logging
 
+# Flask, requests и cProfile импортируются лениво: ядро и офлайн-команды
+# (validate, stats, export) не должны платить за веб-стек при запуске.
+
 # Логирование
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def quiet_logging():
+    """
+    Оставляет в логе ядра только предупреждения и ошибки.
+    Нужно утилитам (бенчмарки, симулятор, офлайн-команды): узел пишет
+    в INFO каждый проверяемый блок.
+    """
+    logger.setLevel(logging.WARNING)
+
+# Метрики в текстовом формате Prometheus
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    inner = ','.join(f'{k}="{v}"' for k, v in pairs)
+    return '{' + inner + '}'
+
+class Counter(object):
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+class Gauge(object):
+    def __init__(self, name, documentation, function):
+        """
+        :param function: <callable> Возвращает текущее значение в момент сбора метрик
+        """
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def render(self):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} gauge',
+            f'{self.name} {self.function()}',
+        ]
+
+class Histogram(object):
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [счетчики по корзинам..., сумма, количество]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self):
+        """
+        Декоратор: замеряет длительность вызова функции.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, ('le', bound))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _format_labels(self.labelnames, labels, ('le', '+Inf'))
+            lines.append(f'{self.name}_bucket{le} {state[-1]}')
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{suffix} {state[-2]}')
+            lines.append(f'{self.name}_count{suffix} {state[-1]}')
+        return lines
+
+class Metrics(object):
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+POW_HASHES = metrics.register(Counter(
+    'mhchain_pow_hashes_total', 'Количество хешей, посчитанных при майнинге'))
+POW_SECONDS = metrics.register(Histogram(
+    'mhchain_pow_seconds', 'Время поиска доказательства работы'))
+VALID_CHAIN_SECONDS = metrics.register(Histogram(
+    'mhchain_valid_chain_seconds', 'Время проверки цепи'))
+RESOLVE_SECONDS = metrics.register(Histogram(
+    'mhchain_resolve_conflicts_seconds', 'Время работы алгоритма консенсуса'))
+PEER_FETCH_SECONDS = metrics.register(Histogram(
+    'mhchain_peer_fetch_seconds', 'Время получения цепи от соседнего узла'))
+PEER_FETCH_ERRORS = metrics.register(Counter(
+    'mhchain_peer_fetch_errors_total', 'Неудачные запросы к соседним узлам'))
+TRANSACTIONS = metrics.register(Counter(
+    'mhchain_transactions_total', 'Принятые транзакции'))
+REJECTED_TRANSACTIONS = metrics.register(Counter(
+    'mhchain_transactions_rejected_total', 'Отклоненные транзакции', ('reason',)))
+HTTP_REQUESTS = metrics.register(Counter(
+    'mhchain_http_requests_total', 'HTTP-запросы', ('route', 'method', 'status')))
+HTTP_SECONDS = metrics.register(Histogram(
+    'mhchain_http_request_seconds', 'Время обработки HTTP-запроса', ('route', 'method')))
+
+# Проверка транзакций
+REWARD_SENDER = "0"
+
+def _schema_error(tx):
+    """
+    Проверка структуры и типов транзакции.
+
+    :param tx: <dict> Транзакция
+    :return: <str> Причина отказа или None, если транзакция корректна
+    """
+    if not isinstance(tx, dict):
+        return 'Not an object'
+    if not all(k in tx for k in ('sender', 'recipient', 'amount')):
+        return 'Missing values'
+    for key in ('sender', 'recipient'):
+        if not isinstance(tx[key], str) or not tx[key]:
+            return f'Invalid {key}'
+    amount = tx['amount']
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        return 'Amount is not a number'
+    try:
+        finite = math.isfinite(amount)
+    except OverflowError:
+        # Целое за пределами float - в балансах такие суммы не складываются
+        finite = False
+    if not finite:
+        return 'Invalid amount'
+    if amount <= 0:
+        return 'Amount must be positive'
+    if tx['sender'] == tx['recipient']:
+        return 'Sender equals recipient'
+    return None
+
+# Профилирование по запросу: следующие N вызовов майнинга и консенсуса
+class Profiler(object):
+    def __init__(self):
+        self.remaining = 0
+        self.mode = 'sample'
+        self.output_dir = 'profiles'
+        self.interval = 0.005
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self, count, mode='sample', output_dir=None, interval=None):
+        """
+        Включает профилирование следующих count вызовов.
+
+        :param count: <int> Сколько вызовов профилировать
+        :param mode: <str> 'sample' - выборка стеков (формат для flame graph),
+                           'cprofile' - детерминированный cProfile (.prof для pstats)
+        :param output_dir: (Optional) <str> Каталог для результатов
+        :param interval: (Optional) <float> Период выборки в секундах
+        """
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f'Неизвестный режим профилирования: {mode}')
+        if count < 0:
+            raise ValueError('Количество вызовов не может быть отрицательным')
+        if interval is not None and not interval > 0:
+            raise ValueError('Период выборки должен быть положительным')
+
+        with self._lock:
+            self.remaining = count
+            self.mode = mode
+            if output_dir:
+                self.output_dir = output_dir
+            if interval is not None:
+                self.interval = interval
+        logger.info(f"Профилирование включено на {count} вызовов ({mode})")
+
+    def profiled(self, name):
+        """
+        Декоратор: пока профилирование включено, вызов выполняется под сборщиком.
+        Вложенные вызовы (valid_chain внутри resolve_conflicts) попадают
+        в профиль внешнего вызова.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                # Быстрый путь: профилирование выключено
+                if self.remaining <= 0 or getattr(self._local, 'active', False):
+                    return func(*args, **kwargs)
+
+                with self._lock:
+                    mode = self.mode if self.remaining > 0 else None
+                    self.remaining -= mode is not None
+                if mode is None:
+                    return func(*args, **kwargs)
+
+                self._local.active = True
+                try:
+                    if mode == 'cprofile':
+                        return self._run_cprofile(name, func, args, kwargs)
+                    return self._run_sampled(name, func, args, kwargs)
+                finally:
+                    self._local.active = False
+            return wrapper
+        return decorator
+
+    def list_files(self, limit=100):
+        """
+        Последние результаты профилирования из каталога output_dir.
+
+        :param limit: <int> Сколько файлов вернуть
+        :return: <list> Пути, от старых к новым
+        """
+        if not os.path.isdir(self.output_dir):
+            return []
+        paths = [
+            os.path.join(self.output_dir, name) for name in os.listdir(self.output_dir)
+            if name.endswith(('.folded', '.prof'))
+        ]
+        paths.sort(key=os.path.getmtime)
+        return paths[-limit:]
+
+    def _output_path(self, name, extension):
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f'{name}-{time():.6f}.{extension}')
+
+    def _run_cprofile(self, name, func, args, kwargs):
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            path = self._output_path(name, 'prof')
+            profile.dump_stats(path)
+            logger.info(f"Профиль сохранен: {path}")
+
+    def _run_sampled(self, name, func, args, kwargs):
+        target = threading.get_ident()
+        stacks = {}
+        done = threading.Event()
+
+        def sampler():
+            while not done.is_set():
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                if stack:
+                    key = ';'.join(reversed(stack))
+                    stacks[key] = stacks.get(key, 0) + 1
+                sleep(self.interval)
+
+        thread = threading.Thread(target=sampler, daemon=True)
+        thread.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            done.set()
+            thread.join()
+            # Свернутые стеки: "корень;...;лист количество" - вход для flamegraph.pl/speedscope
+            path = self._output_path(name, 'folded')
+            with open(path, 'w') as fw:
+                for stack, count in sorted(stacks.items()):
+                    fw.write(f'{stack} {count}\n')
+            logger.info(f"Профиль сохранен: {path}")
+
+profiler = Profiler()
+
 class Blockchain(object):
+    # Источник меток времени блоков (симулятор подставляет виртуальные часы)
+    clock = staticmethod(time)
+
     def __init__(self):
         self.chain = []
         self.current_transactions = []
         self.nodes = set()
 
+        # Индексы цепи: хеши блоков (по позиции в цепи) и балансы адресов
+        self.block_hashes = []
+        self.balances = {}
+
+        # Хранилище снимков и журнал блоков (включается через open_storage)
+        self.snapshot_dir = None
+        self.journal_path = None
+        self.snapshot_interval = 0
+        self._snapshot_thread = None
+        self._snapshot_lock = threading.Lock()
+        # Увеличивается при каждой перезаписи журнала
+        self._journal_generation = 0
+        # Сбрасывается, если фоновая проверка снимка нашла ошибку
+        self.healthy = True
+        # Режим только для чтения (офлайн-утилиты): ни журнал, ни снимки,
+        # ни архив на диске не создаются и не изменяются
+        self.readonly = False
+
+        # Архив тел старых блоков (включается через enable_pruning)
+        self.archive_dir = None
+        self.prune_depth = 0
+        self.segment_size = 0
+        self.archived_height = 0
+        self._segment_cache = (None, None)
+
         # Генезис-блок
         self.new_block(prevhash='1', proof=100)
 
@@ -37,6 +377,8 @@ class Blockchain(object):
         else:
             logger.error("Некорректный адрес")
 
+    @profiler.profiled('valid_chain')
+    @VALID_CHAIN_SECONDS.time()
     def valid_chain(self, chain):
         """
         Проверяем, является ли внесенный в блок хеш корректным.
@@ -53,7 +395,8 @@ class Blockchain(object):
 
         while current_index < len(chain):
             block = chain[current_index]
-            logger.info(f'Проверка блока: {block}')
+            # Блок форматируется, только если INFO включен
+            logger.info('Проверка блока: %s', block)
             
             if block['previous_hash'] != self.hash(last_block):
                 logger.error("Неверный хеш предыдущего блока")
@@ -68,6 +411,8 @@ class Blockchain(object):
 
         return True
 
+    @profiler.profiled('resolve_conflicts')
+    @RESOLVE_SECONDS.time()
     def resolve_conflicts(self):
         """
         Алгоритм Консенсуса, который разрешает конфликты,
@@ -81,27 +426,48 @@ class Blockchain(object):
         max_length = len(self.chain)
 
         for node in neighbours:
-            try:
-                response = requests.get(f'http://{node}/chain')
+            fetched = self.fetch_chain(node)
+            if fetched is None:
+                continue
 
-                if response.status_code == 200:
-                    length = response.json()['length']
-                    chain = response.json()['chain']
-
-                    if length > max_length and self.valid_chain(chain):
-                        max_length = length
-                        new_chain = chain
-            except requests.ConnectionError:
-                logger.error(f"Не удалось подключиться к узлу {node}")
+            length, chain = fetched
+            if length > max_length and self.valid_chain(chain):
+                max_length = length
+                new_chain = chain
 
         if new_chain:
-            self.chain = new_chain
+            self.replace_chain(new_chain)
             logger.info("Цепь была заменена")
             return True
 
         logger.info("Цепь является авторитетной")
         return False
 
+    def fetch_chain(self, node):
+        """
+        Запрашивает цепь у соседнего узла. Это единственная точка сетевого
+        обмена при консенсусе - симулятор подменяет её транспортом в памяти.
+
+        :param node: <str> Адрес узла, например: '192.168.0.5:5000'
+        :return: <tuple> (длина, цепь) или None, если узел не ответил
+        """
+        import requests
+
+        try:
+            start = perf_counter()
+            response = requests.get(f'http://{node}/chain')
+            PEER_FETCH_SECONDS.observe(perf_counter() - start)
+        except requests.ConnectionError:
+            PEER_FETCH_ERRORS.inc()
+            logger.error(f"Не удалось подключиться к узлу {node}")
+            return None
+
+        if response.status_code != 200:
+            return None
+
+        values = response.json()
+        return values['length'], values['chain']
+
     def new_block(self, proof, prevhash=None):
         """
         Создает новый блок в блокчейне.
@@ -112,16 +478,150 @@ class Blockchain(object):
         """
         block = {
             'index': len(self.chain) + 1,
-            'timestamp': time(),
+            'timestamp': self.clock(),
             'transactions': self.current_transactions,
             'proof': proof,
-            'previous_hash': prevhash or self.hash(self.chain[-1]),
+            'previous_hash': prevhash or self.block_hashes[-1],
         }
 
         self.current_transactions = []
         self.chain.append(block)
+        self._index_block(block)
+        if self.archive_dir:
+            self.prune()
+        self._journal_block(block)
         return block
 
+    def new_transaction(self, sender, recipient, amount):
+        """
+        Добавляет новую транзакцию в список, который попадет в следующий блок.
+
+        :param sender: <str> Адрес отправителя
+        :param recipient: <str> Адрес получателя
+        :param amount: <int> Сумма
+        :return: <int> Индекс блока, в который попадет транзакция
+        """
+        self.current_transactions.append({
+            'sender': sender,
+            'recipient': recipient,
+            'amount': amount,
+        })
+        TRANSACTIONS.inc()
+
+        return len(self.chain) + 1
+
+    def validate_transactions(self, transactions, pending=(), allow_reward=False):
+        """
+        Поэтапная проверка пачки транзакций, от дешевых проверок к дорогим:
+        структура и типы, дубликаты, затем перерасход по балансам.
+        Суммы списаний считаются по отправителям за один проход по пачке,
+        и только перерасходовавшие отправители разбираются по одной транзакции.
+
+        :param transactions: <list> Проверяемые транзакции
+        :param pending: <list> Уже принятые транзакции, еще не попавшие в блок
+        :param allow_reward: <bool> Разрешить отправителя "0" (награда за майнинг)
+        :return: <tuple> (принятые транзакции, [(транзакция, причина), ...])
+        """
+        rejected = []
+
+        # 1. Структура и типы
+        candidates = []
+        for tx in transactions:
+            error = _schema_error(tx)
+            if error is None and tx['sender'] == REWARD_SENDER and not allow_reward:
+                error = 'Reward transactions are not accepted'
+            if error is not None:
+                rejected.append((tx, error))
+                continue
+            candidates.append({'sender': tx['sender'], 'recipient': tx['recipient'], 'amount': tx['amount']})
+
+        # 2. Дубликаты внутри пачки и среди ожидающих
+        seen = {(tx['sender'], tx['recipient'], tx['amount']) for tx in pending}
+        unique = []
+        for tx in candidates:
+            key = (tx['sender'], tx['recipient'], tx['amount'])
+            if key in seen:
+                rejected.append((tx, 'Duplicate transaction'))
+                continue
+            seen.add(key)
+            unique.append(tx)
+
+        # 3. Перерасход: баланс из индекса минус уже ожидающие списания
+        spent = {}
+        for tx in itertools.chain(pending, unique):
+            if tx['sender'] != REWARD_SENDER:
+                spent[tx['sender']] = spent.get(tx['sender'], 0) + tx['amount']
+
+        overdrawn = {
+            sender for sender, total in spent.items()
+            if total > self.balances.get(sender, 0)
+        }
+
+        accepted = unique
+        if overdrawn:
+            available = {sender: self.balances.get(sender, 0) for sender in overdrawn}
+            for tx in pending:
+                if tx['sender'] in available:
+                    available[tx['sender']] -= tx['amount']
+
+            accepted = []
+            for tx in unique:
+                sender = tx['sender']
+                if sender in available:
+                    if tx['amount'] > available[sender]:
+                        rejected.append((tx, 'Insufficient funds'))
+                        continue
+                    available[sender] -= tx['amount']
+                accepted.append(tx)
+
+        for _, reason in rejected:
+            REJECTED_TRANSACTIONS.inc(1, reason)
+
+        return accepted, rejected
+
+    def add_transactions(self, transactions):
+        """
+        Проверяет пачку транзакций и добавляет прошедшие проверку в следующий блок.
+
+        :param transactions: <list> Транзакции
+        :return: <tuple> (индекс блока, [(транзакция, причина), ...])
+        """
+        accepted, rejected = self.validate_transactions(transactions, self.current_transactions)
+        for tx in accepted:
+            self.new_transaction(tx['sender'], tx['recipient'], tx['amount'])
+        return len(self.chain) + 1, rejected
+
+    def revalidate_mempool(self):
+        """
+        Повторная проверка ожидающих транзакций перед сборкой блока:
+        после замены цепи балансы могли измениться.
+
+        :return: <list> [(транзакция, причина), ...] для выброшенных транзакций
+        """
+        self.current_transactions, rejected = self.validate_transactions(
+            self.current_transactions, allow_reward=True)
+        if rejected:
+            logger.info(f"Из очереди удалено транзакций: {len(rejected)}")
+        return rejected
+
+    @profiler.profiled('proof_of_work')
+    @POW_SECONDS.time()
+    def proof_of_work(self, last_proof):
+        """
+        Простой алгоритм доказательства работы: ищем число proof такое,
+        что hash(last_proof, proof) содержит 4 ведущих нуля.
+
+        :param last_proof: <int> Доказательство предыдущего блока
+        :return: <int>
+        """
+        proof = 0
+        while self.valid_proof(last_proof, proof) is False:
+            proof += 1
+
+        # Счетчик обновляется один раз за поиск, а не на каждый хеш
+        POW_HASHES.inc(proof + 1)
+        return proof
+
     def valid_proof(self, last_proof, proof):
         """
         Подтверждает доказательство работы.
@@ -145,132 +645,675 @@ class Blockchain(object):
         block_string = json.dumps(block, sort_keys=True).encode()
         return hashlib.sha256(block_string).hexdigest()
 
-app = Flask(__name__)
-blockchain = Blockchain()
-
-@app.route('/mine', methods=['GET'])
-def mine():
-    last_block = blockchain.chain[-1]
-    last_proof = last_block['proof']
-    proof = blockchain.proof_of_work(last_proof)
-
-    blockchain.new_transaction(
-        sender="0",
-        recipient=str(uuid4()).replace('-', ''),
-        amount=1,
-    )
-
-    block = blockchain.new_block(proof)
-
-    response = {
-        'message': "Новый блок создан",
-        'index': block['index'],
-        'transactions': block['transactions'],
-        'proof': block['proof'],
-        'previous_hash': block['previous_hash'],
-    }
-    return jsonify(response), 200
+    def _index_block(self, block):
+        """
+        Обновляет индексы цепи (хеши блоков и балансы) по новому блоку.
 
-@app.route('/transactions/new', methods=['POST'])
-def new_transaction():
-    values = request.get_json()
+        :param block: <dict> Блок, только что добавленный в цепь
+        """
+        self.block_hashes.append(self.hash(block))
+        self._apply_transactions(self.balances, block.get('transactions', []))
 
-    required = ['sender', 'recipient', 'amount']
-    if not all(k in values for k in required):
-        return 'Missing values', 400
+    @staticmethod
+    def _apply_transactions(balances, transactions):
+        """
+        Проводит транзакции блока по балансам.
 
-    index = blockchain.new_transaction(values['sender'], values['recipient'], values['amount'])
+        :param balances: <dict> Балансы адресов, изменяются на месте
+        :param transactions: <list> Транзакции блока
+        """
+        for tx in transactions:
+            amount = tx.get('amount')
+            if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+                continue
+            recipient = tx.get('recipient')
+            sender = tx.get('sender')
+            balances[recipient] = balances.get(recipient, 0) + amount
+            # Награда за майнинг - списывать не с кого
+            if sender != REWARD_SENDER:
+                balances[sender] = balances.get(sender, 0) - amount
 
-    response = {'message': f'Transaction will be added to Block {index}'}
-    return jsonify(response), 201
+    def rebuild_indexes(self):
+        """
+        Полностью пересчитывает индексы по текущей цепи.
+        """
+        self.block_hashes = []
+        self.balances = {}
+        for block in self.chain:
+            self._index_block(block)
 
-@app.route('/chain', methods=['GET'])
-def full_chain():
-    response = {
-        'chain': blockchain.chain,
-        'length': len(blockchain.chain),
-    }
-    return jsonify(response), 200
+    def replace_chain(self, chain):
+        """
+        Заменяет цепь целиком, пересчитывает индексы и, если включено
+        хранилище, удаляет старые снимки, перезаписывает журнал
+        и делает свежий снимок.
+
+        :param chain: <list> Новая цепь
+        """
+        self.chain = chain
+        self.rebuild_indexes()
 
-@app.route('/nodes/register', methods=['POST'])
-def register_nodes():
-    values = request.get_json()
+        if self.journal_path and not self.readonly:
+            # Старые снимки ссылаются на позиции в старом журнале (и на старый
+            # архив) - удаляем их до перезаписи, а запись снимка, начатая
+            # до замены, будет отброшена
+            with self._snapshot_lock:
+                self._journal_generation += 1
+                for name in self._snapshot_files():
+                    os.remove(os.path.join(self.snapshot_dir, name))
 
-    nodes = values.get('nodes')
-    if nodes is None:
-        return "Error: Please supply a valid list of nodes", 400
+        if self.archive_dir:
+            self._clear_archive()
 
-    for node in nodes:
-        blockchain.register_node(node)
+        if self.journal_path:
+            self._rewrite_journal()
 
-    response = {
-        'message': 'Nodes have been added',
-        'total_nodes': list(blockchain.nodes),
-    }
-    return jsonify(response), 201
+        if self.archive_dir:
+            self.prune()
 
-@app.route('/nodes/resolve', methods=['GET'])
-def consensus():
-    replaced = blockchain.resolve_conflicts()
+        if self.journal_path:
+            self.save_snapshot(background=True)
 
-    if replaced:
-        response = {
-            'message': 'Our chain was replaced',
-            'new_chain': blockchain.chain
-        }
-    else:
-        response = {
-            'message': 'Our chain is authoritative',
-            'chain': blockchain.chain
-        }
-    return jsonify(response), 200
+    def open_storage(self, snapshot_dir, snapshot_interval=100, verify=False, readonly=False):
+        """
+        Включает периодические снимки состояния и журнал блоков.
+        Восстанавливает цепь из последнего снимка и доигрывает
+        только те блоки журнала, что были добавлены после него.
 
-@app.route('/save', methods=['GET'])
-def save_json():
-    try:
-        with open('file.json', 'w') as fw:
-            json.dump(blockchain.chain, fw)
+        :param snapshot_dir: <str> Каталог для снимков и журнала
+        :param snapshot_interval: <int> Делать снимок каждые N блоков (0 - не делать)
+        :param verify: <bool> Перепроверить цепь из снимка в фоновом потоке
+        :param readonly: <bool> Только прочитать состояние: журнал не обрезается
+                         и не создается, снимки не пишутся (узел может работать
+                         с этим каталогом одновременно)
+        :return: <int> Количество доигранных из журнала блоков
+        """
+        if readonly:
+            self.readonly = True
+        else:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        self.snapshot_dir = snapshot_dir
+        self.journal_path = os.path.join(snapshot_dir, 'journal.jsonl')
+        self.snapshot_interval = snapshot_interval
 
-        response = {
-            'message': 'Json file saved',
-            'filename': 'file.json',
-        }
-        return jsonify(response), 200
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении файла: {e}")
-        return jsonify({'message': 'Ошибка при сохранении файла'}), 500
+        snapshot = self._latest_snapshot()
+        offset = 0
+        if snapshot is not None:
+            self.chain = snapshot['chain']
+            self.block_hashes = snapshot['block_hashes']
+            # Копия: балансы снимка нужны фоновой проверке после доигрывания журнала
+            self.balances = dict(snapshot['balances'])
+            offset = snapshot['journal_offset']
+            self.archived_height = snapshot.get('archived_height', 0)
+            if self.archived_height:
+                # Тела блоков до archived_height есть только в архиве
+                if not self.archive_dir:
+                    raise RuntimeError(
+                        'Снимок сделан в режиме обрезки: включите обрезку с тем же каталогом архива')
+                if snapshot.get('segment_size') != self.segment_size:
+                    raise RuntimeError(
+                        f"Размер сегмента архива {self.segment_size} не совпадает "
+                        f"со снимком ({snapshot.get('segment_size')})")
+            logger.info(f"Загружен снимок на высоте {snapshot['height']}")
 
-@app.route('/load', methods=['GET'])
-def load_json():
-    try:
-        with open('file.json', 'r') as fr:
-            blockchain.chain = json.load(fr)
+        if not os.path.exists(self.journal_path):
+            # Журнала нет - начинаем его с текущей цепи
+            self._rewrite_journal()
+            replayed = 0
+        else:
+            replayed = self._replay_journal(offset, fresh=snapshot is None)
+        logger.info(f"Доиграно блоков из журнала: {replayed}")
 
-        response = {
-            'message': 'Json file loaded',
-            'filename': 'file.json',
-        }
-        return jsonify(response), 200
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке файла: {e}")
-        return jsonify({'message': 'Ошибка при загрузке файла'}), 500
+        self.prune()
 
-@app.route('/chain/<int:index>', methods=['GET'])
-def get_block(index):
-    try:
-        response = {
-            'chain': blockchain.chain[index-1],
+        if verify and snapshot is not None:
+            threading.Thread(
+                target=self._verify_snapshot, args=(snapshot['height'], snapshot['balances']),
+                daemon=True,
+            ).start()
+
+        return replayed
+
+    def save_snapshot(self, background=False):
+        """
+        Сохраняет снимок цепи и её индексов на текущей высоте.
+        Состояние копируется сразу (копируются только ссылки на блоки),
+        а сериализация и запись на диск могут идти в фоновом потоке,
+        чтобы не задерживать /mine. Файл пишется во временный
+        и атомарно переименовывается.
+
+        :param background: <bool> Писать в фоновом потоке; если предыдущая
+                           запись еще идет, этот снимок пропускается
+        :return: <str> Путь к файлу снимка или None, если запись ушла в фон
+                 или снимок не сделан
+        """
+        if self.readonly:
+            return None
+        if not self.healthy:
+            logger.error("Узел не прошел проверку снимка, новые снимки не пишутся")
+            return None
+
+        snapshot = {
+            'height': len(self.chain),
+            'chain': list(self.chain),
+            'block_hashes': list(self.block_hashes),
+            'balances': dict(self.balances),
+            'journal_offset': os.path.getsize(self.journal_path),
+            'archived_height': self.archived_height,
+            'segment_size': self.segment_size,
         }
-        return jsonify(response), 200
-    except IndexError:
-        logger.error("Блок с данным индексом не найден")
-        return jsonify({'message': 'Блок не найден'}), 404
+
+        generation = self._journal_generation
+
+        if not background:
+            return self._write_snapshot(snapshot, generation)
+
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            logger.info("Предыдущий снимок еще пишется, пропускаем")
+            return None
+
+        self._snapshot_thread = threading.Thread(
+            target=self._write_snapshot, args=(snapshot, generation), daemon=True)
+        self._snapshot_thread.start()
+        return None
+
+    def wait_snapshot(self):
+        """
+        Дожидается окончания фоновой записи снимка.
+        """
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+
+    def _write_snapshot(self, snapshot, generation):
+        path = os.path.join(self.snapshot_dir, f"snapshot-{snapshot['height']:012d}.json")
+        tmp_path = path + '.tmp'
+        with self._snapshot_lock:
+            if generation != self._journal_generation:
+                logger.info("Журнал перезаписан после начала снимка, снимок отброшен")
+                return None
+
+            with open(tmp_path, 'w') as fw:
+                json.dump(snapshot, fw)
+            os.replace(tmp_path, path)
+
+            # Храним только два последних снимка
+            for old in self._snapshot_files()[:-2]:
+                os.remove(os.path.join(self.snapshot_dir, old))
+
+        logger.info(f"Снимок сохранен: {path}")
+        return path
+
+    def _snapshot_files(self):
+        return sorted(
+            name for name in os.listdir(self.snapshot_dir)
+            if name.startswith('snapshot-') and name.endswith('.json')
+        )
+
+    def _latest_snapshot(self):
+        for name in reversed(self._snapshot_files()):
+            path = os.path.join(self.snapshot_dir, name)
+            try:
+                with open(path, 'r') as fr:
+                    snapshot = json.load(fr)
+            except (OSError, ValueError) as e:
+                logger.error(f"Снимок {name} поврежден: {e}")
+                continue
+
+            if self._snapshot_matches_journal(snapshot):
+                return snapshot
+
+            # Снимок от другого журнала (например, остался после замены цепи)
+            logger.error(f"Снимок {name} не соответствует журналу, пропускаем")
+            if not self.readonly:
+                os.remove(path)
+        return None
+
+    def _snapshot_matches_journal(self, snapshot):
+        """
+        Проверяет, что позиция снимка в журнале стоит сразу за записью
+        его последнего блока, а следующая запись продолжает его цепь.
+
+        :param snapshot: <dict> Снимок
+        :return: <bool>
+        """
+        if not os.path.exists(self.journal_path):
+            return True
+
+        offset = snapshot['journal_offset']
+        tip = snapshot['block_hashes'][-1]
+        if offset < 1 or offset > os.path.getsize(self.journal_path):
+            return False
+
+        with open(self.journal_path, 'rb') as fr:
+            fr.seek(offset - 1)
+            if fr.read(1) != b'\n':
+                return False
+
+            # Ищем начало записи, которая заканчивается на offset
+            start = offset - 1
+            while start > 0:
+                step = min(4096, start)
+                fr.seek(start - step)
+                newline = fr.read(step).rfind(b'\n')
+                if newline != -1:
+                    start = start - step + newline + 1
+                    break
+                start -= step
+            fr.seek(start)
+            last = fr.read(offset - start)
+            following = fr.readline()
+
+        try:
+            if self.hash(json.loads(last)) != tip:
+                return False
+            # Недописанная последняя запись - это не расхождение, её обрежет доигрывание
+            if following.endswith(b'\n'):
+                block = json.loads(following)
+                return isinstance(block, dict) and block.get('previous_hash') == tip
+        except ValueError:
+            return False
+        return True
+
+    def _journal_block(self, block):
+        if not self.journal_path or self.readonly:
+            return
+
+        with open(self.journal_path, 'a') as fw:
+            fw.write(json.dumps(block, sort_keys=True) + '\n')
+
+        if self.snapshot_interval and len(self.chain) % self.snapshot_interval == 0:
+            self.save_snapshot(background=True)
+
+    def _rewrite_journal(self):
+        if self.readonly:
+            return
+
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w') as fw:
+            for block in self.chain:
+                fw.write(json.dumps(block, sort_keys=True) + '\n')
+        os.replace(tmp_path, self.journal_path)
+
+    def _replay_journal(self, offset, fresh=False):
+        """
+        Доигрывает блоки журнала начиная с позиции offset.
+        Каждый блок проверяется по хешу предыдущего и доказательству работы;
+        журнал обрезается на первом некорректном блоке (в режиме только
+        для чтения доигрывание просто останавливается на нем).
+
+        :param offset: <int> Позиция в журнале, на которой был сделан снимок
+        :param fresh: <bool> Снимка нет - цепь строится с генезис-блока журнала
+        :return: <int> Количество доигранных блоков
+        """
+        if fresh:
+            self.chain = []
+            self.block_hashes = []
+            self.balances = {}
+            self.archived_height = 0
+            self._segment_cache = (None, None)
+
+        replayed = 0
+        with open(self.journal_path, 'rb') as fr:
+            fr.seek(offset)
+            good_offset = offset
+            for line in fr:
+                try:
+                    block = json.loads(line)
+                except ValueError:
+                    logger.error("Поврежденная запись в журнале")
+                    break
+
+                if self.chain:
+                    if block.get('previous_hash') != self.block_hashes[-1]:
+                        logger.error("Неверный хеш предыдущего блока в журнале")
+                        break
+                    if not self.valid_proof(self.chain[-1]['proof'], block['proof']):
+                        logger.error("Неверное доказательство работы в журнале")
+                        break
+
+                self.chain.append(block)
+                self._index_block(block)
+                good_offset += len(line)
+                replayed += 1
+
+        # Обрезаем только хвост: truncate за концом файла дописал бы нули
+        if good_offset < os.path.getsize(self.journal_path) and not self.readonly:
+            with open(self.journal_path, 'r+b') as fw:
+                fw.truncate(good_offset)
+
+        if not self.chain:
+            self.new_block(prevhash='1', proof=100)
+
+        return replayed
+
+    def enable_pruning(self, archive_dir, depth, segment_size=1000, readonly=False):
+        """
+        Включает режим обрезки: тела блоков глубже depth от вершины цепи
+        выгружаются сегментами по segment_size блоков в сжатые файлы,
+        в памяти остаются только заголовки и индексы.
+
+        :param archive_dir: <str> Каталог для архивных сегментов
+        :param depth: <int> Сколько последних блоков хранить целиком
+        :param segment_size: <int> Количество блоков в одном сегменте
+        :param readonly: <bool> Только читать существующий архив
+        """
+        if depth < 1 or segment_size < 1:
+            raise ValueError('Глубина и размер сегмента должны быть положительными')
+
+        if readonly:
+            self.readonly = True
+        else:
+            os.makedirs(archive_dir, exist_ok=True)
+        self.archive_dir = archive_dir
+        self.prune_depth = depth
+
+        # Размер сегмента хранится в манифесте: при другом размере
+        # номера сегментов перестали бы совпадать с номерами блоков
+        manifest_path = os.path.join(archive_dir, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as fr:
+                saved = json.load(fr)['segment_size']
+            if saved != segment_size and self._has_segments():
+                logger.warning(f"Архив записан сегментами по {saved} блоков, используем его размер")
+                segment_size = saved
+        self.segment_size = segment_size
+        if self.readonly:
+            return
+
+        with open(manifest_path, 'w') as fw:
+            json.dump({'segment_size': segment_size}, fw)
+
+        self.prune()
+
+    def prune(self):
+        """
+        Выгружает в архив все полные сегменты старше глубины обрезки.
+
+        :return: <int> Количество выгруженных блоков
+        """
+        if not self.archive_dir or self.readonly:
+            return 0
+
+        archived = 0
+        while len(self.chain) - self.prune_depth >= self.archived_height + self.segment_size:
+            first = self.archived_height
+            last = first + self.segment_size
+            bodies = [block['transactions'] for block in self.chain[first:last]]
+
+            path = self._segment_path(first // self.segment_size)
+            tmp_path = path + '.tmp'
+            with gzip.open(tmp_path, 'wt') as fw:
+                json.dump(bodies, fw)
+            os.replace(tmp_path, path)
+
+            for i in range(first, last):
+                self.chain[i] = {k: v for k, v in self.chain[i].items() if k != 'transactions'}
+
+            self.archived_height = last
+            archived += self.segment_size
+
+        if archived:
+            logger.info(f"В архив выгружено блоков: {archived}")
+        return archived
+
+    def get_block(self, index):
+        """
+        Возвращает блок целиком, при необходимости подгружая тело из архива.
+
+        :param index: <int> Номер блока, начиная с 1
+        :return: <dict> Блок
+        """
+        if index < 1 or index > len(self.chain):
+            raise IndexError(index)
+
+        block = self.chain[index - 1]
+        if index > self.archived_height:
+            return block
+
+        number, offset = divmod(index - 1, self.segment_size)
+        return dict(block, transactions=self._load_segment(number)[offset])
+
+    def export_chain(self):
+        """
+        Возвращает всю цепь с телами блоков (для отдачи соседям и сохранения).
+
+        :return: <list>
+        """
+        if not self.archived_height:
+            return self.chain
+        return [self.get_block(i) for i in range(1, len(self.chain) + 1)]
+
+    def _segment_path(self, number):
+        return os.path.join(self.archive_dir, f'segment-{number:08d}.json.gz')
+
+    def _load_segment(self, number):
+        cached_number, bodies = self._segment_cache
+        if cached_number != number:
+            with gzip.open(self._segment_path(number), 'rt') as fr:
+                bodies = json.load(fr)
+            self._segment_cache = (number, bodies)
+        return bodies
+
+    def _has_segments(self):
+        if not os.path.isdir(self.archive_dir):
+            return False
+        return any(name.startswith('segment-') for name in os.listdir(self.archive_dir))
+
+    def _clear_archive(self):
+        if not self.readonly:
+            for name in os.listdir(self.archive_dir):
+                if name.startswith('segment-'):
+                    os.remove(os.path.join(self.archive_dir, name))
+        self.archived_height = 0
+        self._segment_cache = (None, None)
+
+    def _verify_snapshot(self, height, balances):
+        """
+        Фоновая проверка цепи, загруженной из снимка, без проверки журнала.
+        Блоки проверяются по одному (архивные тела подгружаются посегментно),
+        поэтому целая цепь с телами в памяти не собирается. Балансы
+        пересчитываются по ходу проверки и сравниваются с балансами снимка.
+
+        Если проверка не пройдена, узел помечается нездоровым, новые снимки
+        не пишутся, а файлы снимков откладываются (*.bad) - при следующем
+        запуске цепь будет доиграна из журнала с генезиса с полной проверкой.
+
+        :param height: <int> Высота снимка
+        :param balances: <dict> Балансы из снимка (до доигрывания журнала)
+        :return: <bool> True, если снимок прошел проверку
+        """
+        chain = self.chain
+        hashes = self.block_hashes
+        computed = {}
+        previous = None
+        error = None
+
+        for i in range(height):
+            if self.chain is not chain:
+                logger.info("Цепь заменена во время проверки снимка, проверка прервана")
+                return True
+
+            block = chain[i]
+            if not isinstance(block, dict) or 'proof' not in block:
+                error = f"блок {i + 1} поврежден"
+                break
+            if 'transactions' not in block:
+                if i >= self.archived_height:
+                    error = f"в блоке {i + 1} нет транзакций"
+                    break
+                number, offset = divmod(i, self.segment_size)
+                try:
+                    block = dict(block, transactions=self._load_segment(number)[offset])
+                except (OSError, ValueError, IndexError) as e:
+                    error = f"не удалось прочитать архив: {e}"
+                    break
+
+            try:
+                if self.hash(block) != hashes[i]:
+                    error = f"хеш блока {i + 1} не совпадает с индексом"
+                    break
+                if previous is not None:
+                    if block.get('previous_hash') != hashes[i - 1]:
+                        error = f"неверный хеш предыдущего блока в блоке {i + 1}"
+                        break
+                    if not self.valid_proof(previous['proof'], block['proof']):
+                        error = f"неверное доказательство работы в блоке {i + 1}"
+                        break
+                self._apply_transactions(computed, block['transactions'])
+            except (TypeError, ValueError, AttributeError, IndexError) as e:
+                error = f"блок {i + 1} поврежден: {e}"
+                break
+            previous = block
+
+        if error is None and computed != balances:
+            error = "балансы не совпадают с цепью"
+
+        if error is None:
+            logger.info("Цепь из снимка прошла проверку")
+            return True
+
+        logger.error(f"Цепь из снимка не прошла проверку: {error}")
+        self.healthy = False
+        if self.readonly:
+            return False
+        with self._snapshot_lock:
+            for name in self._snapshot_files():
+                path = os.path.join(self.snapshot_dir, name)
+                os.replace(path, path + '.bad')
+        return False
+
+# Обратная совместимость: mhchain.app и mhchain.blockchain (например, gunicorn mhchain:app)
+def __getattr__(name):
+    if name in ('app', 'blockchain'):
+        import mhchain_server
+        return getattr(mhchain_server, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def load_chain_file(path):
+    """
+    Читает цепь из файла: список блоков (как пишет /save) или {"chain": [...]}.
+
+    :param path: <str> Путь к файлу
+    :return: <list> Блоки
+    """
+    with open(path, encoding='utf-8') as fr:
+        data = json.load(fr)
+    chain = data['chain'] if isinstance(data, dict) else data
+    if not isinstance(chain, list):
+        raise ValueError('Ожидался список блоков')
+    for i, block in enumerate(chain, 1):
+        if not isinstance(block, dict):
+            raise ValueError(f'Блок {i} не является объектом')
+        transactions = block.get('transactions', [])
+        if not isinstance(transactions, list) or not all(isinstance(tx, dict) for tx in transactions):
+            raise ValueError(f'Транзакции блока {i} должны быть списком объектов')
+    return chain
+
+def chain_stats(chain):
+    """
+    Сводка по цепи для команды stats.
+
+    :param chain: <list> Блоки
+    :return: <dict>
+    """
+    node = Blockchain()
+    node.replace_chain(chain)
+    transactions = [tx for block in chain for tx in block.get('transactions', [])]
+    timestamps = [block['timestamp'] for block in chain if 'timestamp' in block]
+    return {
+        'length': len(chain),
+        'transactions': len(transactions),
+        'mining_rewards': sum(1 for tx in transactions if tx.get('sender') == REWARD_SENDER),
+        'addresses': len(node.balances),
+        'first_timestamp': min(timestamps) if timestamps else None,
+        'last_timestamp': max(timestamps) if timestamps else None,
+        'tip_hash': node.block_hashes[-1] if node.block_hashes else None,
+    }
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='mhchain.py', description='Узел и утилиты mhchain')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Подробный лог')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    server_parser = commands.add_parser('server', help='Запустить HTTP-узел')
+    server_parser.add_argument('host')
+    server_parser.add_argument('port', type=int)
+
+    validate_parser = commands.add_parser('validate', help='Проверить файлы цепей')
+    validate_parser.add_argument('files', nargs='+')
+
+    stats_parser = commands.add_parser('stats', help='Сводка по файлу цепи')
+    stats_parser.add_argument('file')
+
+    export_parser = commands.add_parser('export', help='Выгрузить цепь из снимков и журнала узла')
+    export_parser.add_argument('snapshot_dir')
+    export_parser.add_argument('-o', '--output', help='Файл (по умолчанию stdout)')
+    export_parser.add_argument('--archive-dir', help='Каталог архива, если узел работал с обрезкой')
+    export_parser.add_argument('--segment-size', type=int, default=1000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'server':
+        import mhchain_server
+
+        mhchain_server.serve(args.host, args.port)
+        return 0
+
+    if not args.verbose:
+        quiet_logging()
+
+    if args.command == 'validate':
+        failed = 0
+        for path in args.files:
+            try:
+                valid = Blockchain().valid_chain(load_chain_file(path))
+                reason = None if valid else 'цепь недействительна'
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                reason = f'{type(e).__name__}: {e}'
+            if reason is None:
+                print(f'{path}: OK')
+            else:
+                failed += 1
+                print(f'{path}: FAIL ({reason})')
+        return 1 if failed else 0
+
+    if args.command == 'stats':
+        try:
+            stats = chain_stats(load_chain_file(args.file))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f'{args.file}: {type(e).__name__}: {e}', file=sys.stderr)
+            return 2
+        print(json.dumps(dict(stats, file=args.file), indent=2, ensure_ascii=False))
+        return 0
+
+    if args.command == 'export':
+        if not os.path.isdir(args.snapshot_dir):
+            print(f'Каталог не найден: {args.snapshot_dir}', file=sys.stderr)
+            return 2
+
+        # Только чтение: узел может в это время дописывать тот же журнал
+        node = Blockchain()
+        try:
+            if args.archive_dir:
+                node.enable_pruning(args.archive_dir, sys.maxsize, args.segment_size, readonly=True)
+            node.open_storage(args.snapshot_dir, snapshot_interval=0, readonly=True)
+        except RuntimeError as e:
+            print(f'{e} (--archive-dir)', file=sys.stderr)
+            return 2
+
+        text = json.dumps(node.export_chain())
+        if args.output:
+            with open(args.output, 'w') as fw:
+                fw.write(text)
+        else:
+            print(text)
+        return 0
 
 if __name__ == '__main__':
-    if len(sys.argv) < 4 or sys.argv[1] != 'server':
-        raise RuntimeError("Используйте: mhchain.py server [host] [port]")
+    # Запускаем main из импортированного модуля mhchain, а не из __main__:
+    # иначе mhchain_server загрузил бы вторую копию ядра со своими метриками
+    import mhchain
 
-    host = sys.argv[2]
-    port = int(sys.argv[3])
-    logger.info(f'Добро пожаловать в mhchain на {host}:{port}')
-    app.run(host, port)
\ No newline at end of file
+    sys.exit(mhchain.main())
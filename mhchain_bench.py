@@ -0,0 +1,341 @@
+"""
+Бенчмарки ядра mhchain и HTTP-эндпоинтов.
+
+Примеры:
+    python mhchain_bench.py                              # все размеры: 1k, 100k, 1M блоков
+    python mhchain_bench.py --sizes 1000 --output bench.json
+    python mhchain_bench.py --save-baseline bench_baseline.json
+    python mhchain_bench.py --baseline bench_baseline.json --tolerance 0.2
+
+Результаты печатаются в JSON; при сравнении с базовой линией процесс
+завершается с кодом 1, если какой-то бенчмарк стал медленнее допуска.
+"""
+import os
+import sys
+import re
+import json
+import glob
+import random
+import logging
+import argparse
+import platform
+import threading
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mhchain
+import mhchain_server
+from mhchain import Blockchain
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'json-data')
+
+
+class BenchBlockchain(Blockchain):
+    """
+    Blockchain для синтетических цепей: доказательство работы проверяется
+    с той же стоимостью (один SHA-256), но принимается любое. Настоящие
+    доказательства для 1M блоков пришлось бы майнить часами.
+    """
+    def valid_proof(self, last_proof, proof):
+        Blockchain.valid_proof(self, last_proof, proof)
+        return True
+
+
+def load_fixture(path):
+    """
+    Читает файл цепи из json-data. Часть файлов отредактирована вручную
+    (комментарии //, список блоков без скобок), поэтому разбор терпимый.
+
+    :param path: <str> Путь к файлу
+    :return: <list> Блоки
+    """
+    with open(path, encoding='utf-8') as fr:
+        text = fr.read()
+    text = re.sub(r'^\s*//.*$', '', text, flags=re.MULTILINE)
+
+    for candidate in (text, f'[{text}]'):
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        return data['chain'] if isinstance(data, dict) else data
+    raise ValueError(f'Не удалось разобрать {path}')
+
+
+def load_templates():
+    """
+    Собирает списки транзакций из фикстур - ими наполняются синтетические блоки.
+
+    :return: <list> Списки транзакций
+    """
+    templates = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.json'))):
+        try:
+            chain = load_fixture(path)
+        except ValueError as e:
+            logging.warning(e)
+            continue
+        templates.extend(block['transactions'] for block in chain if block.get('transactions'))
+    return templates or [[{'sender': '0', 'recipient': 'bench', 'amount': 1}]]
+
+
+def synthetic_chain(length, templates, seed=0):
+    """
+    Строит цепь заданной длины с корректными хешами предыдущих блоков.
+
+    :param length: <int> Количество блоков
+    :param templates: <list> Списки транзакций для тел блоков
+    :param seed: <int> Зерно генератора случайных чисел
+    :return: <list>
+    """
+    rng = random.Random(seed)
+    chain = []
+    previous_hash = '1'
+    for i in range(length):
+        block = {
+            'index': i + 1,
+            'timestamp': 1656405936.0 + i,
+            'transactions': rng.choice(templates) if i else [],
+            'proof': rng.randrange(1 << 20),
+            'previous_hash': previous_hash,
+        }
+        previous_hash = Blockchain.hash(block)
+        chain.append(block)
+    return chain
+
+
+def measure(func, ops, repeat, setup=None):
+    """
+    Запускает func repeat раз и берет лучшее время.
+
+    :param setup: (Optional) <callable> Подготовка перед каждым повтором, вне замера
+    :return: <dict> ops, seconds, ops_per_sec
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        func()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'ops': ops, 'seconds': best, 'ops_per_sec': ops / best if best else 0.0}
+
+
+def bench_hash(templates, repeat):
+    block = synthetic_chain(2, templates)[1]
+    n = 100000
+
+    def run():
+        for _ in range(n):
+            Blockchain.hash(block)
+    return measure(run, n, repeat)
+
+
+def bench_valid_proof(repeat):
+    node = Blockchain()
+    n = 200000
+
+    def run():
+        for proof in range(n):
+            node.valid_proof(100, proof)
+    return measure(run, n, repeat)
+
+
+def bench_proof_of_work(repeat):
+    # Майним несколько блоков подряд с генезиса; ops - число посчитанных хешей
+    node = Blockchain()
+    blocks = 5
+    before = mhchain.POW_HASHES.get()
+
+    def run():
+        last_proof = 100
+        for _ in range(blocks):
+            last_proof = node.proof_of_work(last_proof)
+    result = measure(run, 0, repeat)
+
+    hashes = (mhchain.POW_HASHES.get() - before) // repeat
+    result['ops'] = hashes
+    result['ops_per_sec'] = hashes / result['seconds']
+    return result
+
+
+def bench_valid_chain(chain, repeat):
+    node = BenchBlockchain()
+    return measure(lambda: node.valid_chain(chain), len(chain), repeat)
+
+
+def bench_new_transaction(templates, repeat):
+    transactions = [tx for txs in templates for tx in txs]
+    n = 100000
+    node = Blockchain()
+
+    def run():
+        node.current_transactions = []
+        for i in range(n):
+            tx = transactions[i % len(transactions)]
+            node.new_transaction(tx['sender'], tx['recipient'], tx['amount'])
+    return measure(run, n, repeat)
+
+
+def bench_validate_transactions(templates, repeat):
+    # Пачка без наград; половине отправителей денег не хватает
+    transactions = [tx for txs in templates for tx in txs if tx['sender'] != '0']
+    transactions = transactions or [{'sender': 'a', 'recipient': 'b', 'amount': 1}]
+    n = 100000
+    batch = [
+        dict(transactions[i % len(transactions)], recipient=f'r{i}')
+        for i in range(n)
+    ]
+    node = Blockchain()
+    senders = sorted({tx['sender'] for tx in batch})
+    for i, sender in enumerate(senders):
+        node.balances[sender] = n if i % 2 else 0
+    return measure(lambda: node.validate_transactions(batch), n, repeat)
+
+
+def bench_chain_endpoint(chain, repeat):
+    node = Blockchain()
+    node.replace_chain(chain)
+    original = mhchain_server.blockchain
+    mhchain_server.blockchain = node
+    client = mhchain_server.app.test_client()
+
+    def run():
+        response = client.get('/chain')
+        assert response.status_code == 200
+    try:
+        return measure(run, len(chain), repeat)
+    finally:
+        mhchain_server.blockchain = original
+
+
+def start_peer(chain):
+    """
+    Поднимает локальный узел-заглушку, который отдает готовую цепь на /chain.
+
+    :return: <ThreadingHTTPServer>
+    """
+    body = json.dumps({'chain': chain, 'length': len(chain)}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_resolve_conflicts(chain, repeat, peers=3):
+    # Соседи отдают более длинную цепь, наш узел хранит ее половину
+    servers = [start_peer(chain) for _ in range(peers)]
+    node = BenchBlockchain()
+    for server in servers:
+        node.register_node(f'http://127.0.0.1:{server.server_port}')
+
+    def setup():
+        node.replace_chain(chain[:len(chain) // 2])
+
+    def run():
+        assert node.resolve_conflicts()
+    try:
+        return measure(run, len(chain), repeat, setup=setup)
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+def run_benchmarks(sizes, repeat, http_limit):
+    templates = load_templates()
+    results = {
+        'hash': bench_hash(templates, repeat),
+        'valid_proof': bench_valid_proof(repeat),
+        'proof_of_work': bench_proof_of_work(repeat),
+        'new_transaction': bench_new_transaction(templates, repeat),
+        'validate_transactions': bench_validate_transactions(templates, repeat),
+    }
+
+    for size in sizes:
+        chain = synthetic_chain(size, templates)
+        results[f'valid_chain[{size}]'] = bench_valid_chain(chain, repeat)
+        # HTTP-бенчмарки гоняют цепь через JSON целиком, большие размеры пропускаем
+        if size <= http_limit:
+            results[f'chain_endpoint[{size}]'] = bench_chain_endpoint(chain, repeat)
+            results[f'resolve_conflicts[{size}]'] = bench_resolve_conflicts(chain, repeat)
+        del chain
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Сравнивает ops_per_sec с базовой линией.
+
+    :return: <list> Имена бенчмарков, ставших медленнее допуска
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('ops_per_sec'):
+            continue
+        ratio = result['ops_per_sec'] / base['ops_per_sec']
+        result['baseline_ratio'] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарки mhchain')
+    parser.add_argument('--sizes', default='1000,100000,1000000',
+                        help='Длины синтетических цепей через запятую')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов на бенчмарк (берется лучший)')
+    parser.add_argument('--http-limit', type=int, default=100000,
+                        help='Максимальная длина цепи для /chain и resolve_conflicts')
+    parser.add_argument('--output', help='Куда записать результаты (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='Файл базовой линии для сравнения')
+    parser.add_argument('--save-baseline', help='Сохранить результаты как базовую линию')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Допустимое замедление относительно базовой линии (доля)')
+    args = parser.parse_args(argv)
+
+    mhchain.quiet_logging()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    results = run_benchmarks(sizes, args.repeat, args.http_limit)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as fr:
+            regressions = compare(results, json.load(fr)['results'], args.tolerance)
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+        'regressions': regressions,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fw:
+            fw.write(text)
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fw:
+            json.dump({'results': results}, fw, indent=2, sort_keys=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+HTTP-узел mhchain на Flask. Запуск: python mhchain.py server [host] [port]
+"""
+import os
+import json
+import logging
+from time import perf_counter
+from uuid import uuid4
+from flask import Flask, jsonify, request, g
+
+from mhchain import (
+    Blockchain, Gauge, metrics, profiler, HTTP_REQUESTS, HTTP_SECONDS, REWARD_SENDER,
+)
+
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+blockchain = Blockchain()
+
+metrics.register(Gauge(
+    'mhchain_mempool_size', 'Транзакции, ожидающие включения в блок',
+    lambda: len(blockchain.current_transactions)))
+metrics.register(Gauge(
+    'mhchain_chain_length', 'Длина цепи', lambda: len(blockchain.chain)))
+metrics.register(Gauge(
+    'mhchain_nodes', 'Количество известных узлов', lambda: len(blockchain.nodes)))
+metrics.register(Gauge(
+    'mhchain_healthy', 'Цепь из снимка прошла проверку (1) или нет (0)',
+    lambda: int(blockchain.healthy)))
+
+@app.before_request
+def start_timer():
+    g.request_start = perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_SECONDS.observe(perf_counter() - g.request_start, route, request.method)
+    HTTP_REQUESTS.inc(1, route, request.method, str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+@app.route('/mine', methods=['GET'])
+def mine():
+    last_block = blockchain.chain[-1]
+    last_proof = last_block['proof']
+    proof = blockchain.proof_of_work(last_proof)
+
+    blockchain.revalidate_mempool()
+    blockchain.new_transaction(
+        sender=REWARD_SENDER,
+        recipient=str(uuid4()).replace('-', ''),
+        amount=1,
+    )
+
+    block = blockchain.new_block(proof)
+
+    response = {
+        'message': "Новый блок создан",
+        'index': block['index'],
+        'transactions': block['transactions'],
+        'proof': block['proof'],
+        'previous_hash': block['previous_hash'],
+    }
+    return jsonify(response), 200
+
+@app.route('/transactions/new', methods=['POST'])
+def new_transaction():
+    values = request.get_json(silent=True)
+    if values is None:
+        return 'Missing values', 400
+
+    # Пачка: {"transactions": [...]}, иначе одна транзакция
+    batch = isinstance(values, dict) and isinstance(values.get('transactions'), list)
+    transactions = values['transactions'] if batch else [values]
+
+    index, rejected = blockchain.add_transactions(transactions)
+
+    if not batch:
+        if rejected:
+            return rejected[0][1], 400
+        response = {'message': f'Transaction will be added to Block {index}'}
+        return jsonify(response), 201
+
+    response = {
+        'message': f'Transactions will be added to Block {index}',
+        'accepted': len(transactions) - len(rejected),
+        'rejected': [{'transaction': tx, 'reason': reason} for tx, reason in rejected],
+    }
+    return jsonify(response), 201
+
+@app.route('/chain', methods=['GET'])
+def full_chain():
+    response = {
+        'chain': blockchain.export_chain(),
+        'length': len(blockchain.chain),
+    }
+    return jsonify(response), 200
+
+@app.route('/nodes/register', methods=['POST'])
+def register_nodes():
+    values = request.get_json()
+
+    nodes = values.get('nodes')
+    if nodes is None:
+        return "Error: Please supply a valid list of nodes", 400
+
+    for node in nodes:
+        blockchain.register_node(node)
+
+    response = {
+        'message': 'Nodes have been added',
+        'total_nodes': list(blockchain.nodes),
+    }
+    return jsonify(response), 201
+
+@app.route('/nodes/resolve', methods=['GET'])
+def consensus():
+    replaced = blockchain.resolve_conflicts()
+
+    if replaced:
+        response = {
+            'message': 'Our chain was replaced',
+            'new_chain': blockchain.export_chain()
+        }
+    else:
+        response = {
+            'message': 'Our chain is authoritative',
+            'chain': blockchain.export_chain()
+        }
+    return jsonify(response), 200
+
+@app.route('/save', methods=['GET'])
+def save_json():
+    try:
+        with open('file.json', 'w') as fw:
+            json.dump(blockchain.export_chain(), fw)
+
+        response = {
+            'message': 'Json file saved',
+            'filename': 'file.json',
+        }
+        return jsonify(response), 200
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении файла: {e}")
+        return jsonify({'message': 'Ошибка при сохранении файла'}), 500
+
+@app.route('/load', methods=['GET'])
+def load_json():
+    try:
+        with open('file.json', 'r') as fr:
+            blockchain.replace_chain(json.load(fr))
+
+        response = {
+            'message': 'Json file loaded',
+            'filename': 'file.json',
+        }
+        return jsonify(response), 200
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке файла: {e}")
+        return jsonify({'message': 'Ошибка при загрузке файла'}), 500
+
+@app.route('/snapshot', methods=['GET'])
+def snapshot():
+    if not blockchain.snapshot_dir:
+        return jsonify({'message': 'Снимки не включены'}), 400
+    if not blockchain.healthy:
+        return jsonify({'message': 'Узел не прошел проверку снимка'}), 503
+
+    try:
+        path = blockchain.save_snapshot()
+        response = {
+            'message': 'Snapshot saved',
+            'filename': path,
+            'height': len(blockchain.chain),
+        }
+        return jsonify(response), 200
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении снимка: {e}")
+        return jsonify({'message': 'Ошибка при сохранении снимка'}), 500
+
+@app.route('/health', methods=['GET'])
+def health():
+    response = {
+        'healthy': blockchain.healthy,
+        'length': len(blockchain.chain),
+    }
+    return jsonify(response), 200 if blockchain.healthy else 503
+
+@app.route('/profile', methods=['GET'])
+def profile():
+    count = request.args.get('requests', type=int)
+    if count is not None:
+        try:
+            profiler.start(
+                count,
+                mode=request.args.get('mode', 'sample'),
+                interval=request.args.get('interval', type=float),
+            )
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+    response = {
+        'remaining': profiler.remaining,
+        'mode': profiler.mode,
+        'files': profiler.list_files(),
+    }
+    return jsonify(response), 200
+
+@app.route('/chain/<int:index>', methods=['GET'])
+def get_block(index):
+    try:
+        response = {
+            'chain': blockchain.get_block(index),
+        }
+        return jsonify(response), 200
+    except IndexError:
+        logger.error("Блок с данным индексом не найден")
+        return jsonify({'message': 'Блок не найден'}), 404
+
+
+def serve(host, port):
+    """
+    Настраивает узел по переменным окружения и запускает HTTP-сервер.
+
+    :param host: <str> Адрес для прослушивания
+    :param port: <int> Порт
+    """
+    # Профилирование первых N вызовов майнинга и консенсуса
+    profile_count = int(os.environ.get('MHCHAIN_PROFILE', '0'))
+    if profile_count:
+        profiler.start(
+            profile_count,
+            mode=os.environ.get('MHCHAIN_PROFILE_MODE', 'sample'),
+            output_dir=os.environ.get('MHCHAIN_PROFILE_DIR'),
+        )
+
+    # Обрезка: тела старых блоков уходят в сжатый архив на диске
+    prune_depth = int(os.environ.get('MHCHAIN_PRUNE_DEPTH', '0'))
+    if prune_depth:
+        blockchain.enable_pruning(
+            os.environ.get('MHCHAIN_ARCHIVE_DIR', 'archive'),
+            prune_depth,
+            segment_size=int(os.environ.get('MHCHAIN_SEGMENT_SIZE', '1000')),
+        )
+
+    # Быстрый старт: последний снимок + доигрывание журнала
+    snapshot_dir = os.environ.get('MHCHAIN_SNAPSHOT_DIR')
+    if snapshot_dir:
+        blockchain.open_storage(
+            snapshot_dir,
+            snapshot_interval=int(os.environ.get('MHCHAIN_SNAPSHOT_INTERVAL', '100')),
+            verify=os.environ.get('MHCHAIN_VERIFY_SNAPSHOT') == '1',
+        )
+
+    logger.info(f'Добро пожаловать в mhchain на {host}:{port}')
+    app.run(host, port)
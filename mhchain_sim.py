@@ -0,0 +1,266 @@
+"""
+Детерминированный симулятор сети mhchain в одном процессе.
+
+N узлов Blockchain обмениваются цепями через транспорт в памяти вместо HTTP.
+Время виртуальное (очередь событий), все случайности берутся из одного
+зерна - одинаковые параметры дают одинаковый результат.
+
+Примеры:
+    python mhchain_sim.py --nodes 50 --miners 10 --duration 600
+    python mhchain_sim.py --nodes 50 --latency 0.5 --partition 200:400:0.5 --seed 7
+"""
+import sys
+import json
+import heapq
+import random
+import argparse
+
+from mhchain import Blockchain, REWARD_SENDER, quiet_logging
+
+
+class SimNode(Blockchain):
+    """
+    Узел симулятора: цепи соседей приходят из входящего ящика,
+    куда их складывает сеть с учетом задержки и разделений.
+    """
+    def __init__(self, network, name):
+        self.network = network
+        self.name = name
+        # Ответы соседей, доставленные сетью: адрес -> (длина, цепь)
+        self.inbox = {}
+        super().__init__()
+
+    def clock(self):
+        return self.network.now
+
+    def fetch_chain(self, node):
+        return self.inbox.pop(node, None)
+
+    def proof_of_work(self, last_proof):
+        # Доказательство зависит только от предыдущего, поэтому его можно
+        # посчитать один раз на всю сеть
+        proofs = self.network.proofs
+        if last_proof not in proofs:
+            proofs[last_proof] = super().proof_of_work(last_proof)
+        return proofs[last_proof]
+
+
+class Network(object):
+    def __init__(self, size, peers=8, latency=0.1, jitter=0.05, seed=0):
+        """
+        :param size: <int> Количество узлов
+        :param peers: <int> Сколько соседей регистрирует каждый узел
+        :param latency: <float> Базовая задержка доставки ответа, секунды
+        :param jitter: <float> Максимальная случайная добавка к задержке
+        :param seed: <int> Зерно генератора случайных чисел
+        """
+        self.rng = random.Random(seed)
+        self.now = 0.0
+        self.latency = latency
+        self.jitter = jitter
+        self.proofs = {}
+        self.partitions = []
+        self._events = []
+        self._sequence = 0
+
+        self.bytes_sent = 0
+        self.messages = 0
+        self.dropped = 0
+        self._sizes = {}
+
+        self.nodes = {}
+        for i in range(size):
+            name = f'node{i}'
+            self.nodes[name] = SimNode(self, name)
+
+        names = list(self.nodes)
+        for name, node in self.nodes.items():
+            others = [other for other in names if other != name]
+            for other in self.rng.sample(others, min(peers, len(others))):
+                node.register_node(f'http://{other}')
+
+    def schedule(self, delay, action, *args):
+        self._sequence += 1
+        heapq.heappush(self._events, (self.now + delay, self._sequence, action, args))
+
+    def partition(self, start, end, fraction):
+        """
+        Разделяет сеть на две группы на промежутке [start, end).
+
+        :param fraction: <float> Доля узлов в первой группе
+        """
+        names = list(self.nodes)
+        group = set(names[:int(len(names) * fraction)])
+        self.partitions.append((start, end, group))
+
+    def reachable(self, a, b):
+        for start, end, group in self.partitions:
+            if start <= self.now < end and (a in group) != (b in group):
+                return False
+        return True
+
+    def chain_size(self, node):
+        # Размер цепи в JSON, как если бы она ушла по /chain;
+        # вершина однозначно определяет цепь, поэтому размер кешируется по ней
+        key = node.block_hashes[-1]
+        if key not in self._sizes:
+            self._sizes[key] = len(json.dumps({'chain': node.chain, 'length': len(node.chain)}))
+        return self._sizes[key]
+
+    def sync(self, name):
+        """
+        Узел запрашивает цепи у соседей; ответы доставляются с задержкой.
+        """
+        # Множество узлов упорядочиваем, чтобы не зависеть от PYTHONHASHSEED
+        for peer in sorted(self.nodes[name].nodes):
+            if not self.reachable(name, peer):
+                self.dropped += 1
+                continue
+            source = self.nodes[peer]
+            self.bytes_sent += self.chain_size(source)
+            self.messages += 1
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            self.schedule(delay, self.deliver, name, peer, len(source.chain), list(source.chain))
+
+    def deliver(self, name, peer, length, chain):
+        node = self.nodes[name]
+        if not self.reachable(name, peer):
+            self.dropped += 1
+            return
+        node.inbox[peer] = (length, chain)
+        node.resolve_conflicts()
+
+    def mine(self, name):
+        node = self.nodes[name]
+        proof = node.proof_of_work(node.chain[-1]['proof'])
+        node.new_transaction(sender=REWARD_SENDER, recipient=name, amount=1)
+        block = node.new_block(proof)
+        return node.block_hashes[-1], block
+
+    def tips(self):
+        return {node.block_hashes[-1] for node in self.nodes.values()}
+
+    def run_until(self, deadline, stop=None):
+        """
+        Обрабатывает события до момента deadline или пока stop() не вернет True.
+
+        :return: <bool> True, если остановились по условию stop
+        """
+        while self._events and self._events[0][0] <= deadline:
+            self.now, _, action, args = heapq.heappop(self._events)
+            action(*args)
+            if stop is not None and stop():
+                return True
+        self.now = deadline
+        return False
+
+
+def simulate(nodes=50, peers=8, miners=10, duration=600.0, block_interval=30.0,
+             sync_interval=5.0, latency=0.1, jitter=0.05, partitions=(),
+             settle=300.0, seed=0):
+    """
+    Запускает симуляцию: майнинг в течение duration, затем только синхронизация
+    до совпадения вершин у всех узлов (не дольше settle).
+
+    :param miners: <int> Количество майнящих узлов (конкурируют за блоки)
+    :param block_interval: <float> Средний интервал между блоками во всей сети
+    :param sync_interval: <float> Период вызова консенсуса на каждом узле
+    :param partitions: <list> Кортежи (начало, конец, доля узлов в первой группе)
+    :return: <dict> Результаты
+    """
+    network = Network(nodes, peers=peers, latency=latency, jitter=jitter, seed=seed)
+    for start, end, fraction in partitions:
+        network.partition(start, end, fraction)
+
+    names = list(network.nodes)
+    mining = names[:miners]
+    mined = {}
+    rate = 1.0 / (block_interval * len(mining))
+
+    def mine_event(name):
+        if network.now >= duration:
+            return
+        block_hash, _ = network.mine(name)
+        mined[block_hash] = name
+        network.schedule(network.rng.expovariate(rate), mine_event, name)
+
+    def sync_event(name):
+        network.sync(name)
+        network.schedule(sync_interval, sync_event, name)
+
+    for name in mining:
+        network.schedule(network.rng.expovariate(rate), mine_event, name)
+    for name in names:
+        network.schedule(network.rng.uniform(0, sync_interval), sync_event, name)
+
+    network.run_until(duration)
+    def agreed():
+        return len(network.tips()) == 1
+
+    converged = agreed() or network.run_until(duration + settle, stop=agreed)
+
+    reference = max(network.nodes.values(), key=lambda node: len(node.chain))
+    canonical = set(reference.block_hashes)
+    orphaned = sum(1 for block_hash in mined if block_hash not in canonical)
+
+    return {
+        'nodes': nodes,
+        'miners': len(mining),
+        'seed': seed,
+        'blocks_mined': len(mined),
+        'chain_length': len(reference.chain),
+        'orphaned_blocks': orphaned,
+        'fork_rate': orphaned / len(mined) if mined else 0.0,
+        'converged': converged,
+        'convergence_time': network.now - duration if converged else None,
+        'distinct_tips': len(network.tips()),
+        'messages': network.messages,
+        'dropped_messages': network.dropped,
+        'bytes_sent': network.bytes_sent,
+        'bytes_per_node': network.bytes_sent / nodes,
+    }
+
+
+def parse_partition(value):
+    start, end, fraction = value.split(':')
+    return float(start), float(end), float(fraction)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Симулятор сети mhchain')
+    parser.add_argument('--nodes', type=int, default=50)
+    parser.add_argument('--peers', type=int, default=8, help='Соседей у каждого узла')
+    parser.add_argument('--miners', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=600.0, help='Время майнинга, секунды')
+    parser.add_argument('--block-interval', type=float, default=30.0)
+    parser.add_argument('--sync-interval', type=float, default=5.0)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--partition', type=parse_partition, action='append', default=[],
+                        help='начало:конец:доля - разделить сеть на две группы')
+    parser.add_argument('--settle', type=float, default=300.0,
+                        help='Сколько ждать схождения после остановки майнинга')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    quiet_logging()
+
+    result = simulate(
+        nodes=args.nodes,
+        peers=args.peers,
+        miners=args.miners,
+        duration=args.duration,
+        block_interval=args.block_interval,
+        sync_interval=args.sync_interval,
+        latency=args.latency,
+        jitter=args.jitter,
+        partitions=args.partition,
+        settle=args.settle,
+        seed=args.seed,
+    )
+    print(json.dumps(result, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
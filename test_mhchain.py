@@ -0,0 +1,441 @@
+import json
+import contextlib
+import pathlib
+import threading
+
+import pytest
+
+import mhchain
+from mhchain import Blockchain, REWARD_SENDER
+
+mhchain.quiet_logging()
+
+
+def tx(sender, recipient, amount):
+    return {'sender': sender, 'recipient': recipient, 'amount': amount}
+
+
+# Проверка транзакций
+
+@pytest.mark.parametrize('amount, reason', [
+    ('1', 'Amount is not a number'),
+    (True, 'Amount is not a number'),
+    (None, 'Amount is not a number'),
+    (float('nan'), 'Invalid amount'),
+    (float('inf'), 'Invalid amount'),
+    (10 ** 400, 'Invalid amount'),
+    (0, 'Amount must be positive'),
+    (-5, 'Amount must be positive'),
+])
+def test_malformed_amount_rejected(amount, reason):
+    node = Blockchain()
+    node.balances['a'] = 100
+
+    accepted, rejected = node.validate_transactions([tx('a', 'b', amount)])
+
+    assert accepted == []
+    assert rejected[0][1] == reason
+
+
+def test_missing_values_and_bad_addresses_rejected():
+    node = Blockchain()
+    node.balances['a'] = 100
+
+    accepted, rejected = node.validate_transactions([
+        {'sender': 'a', 'recipient': 'b'},
+        tx('', 'b', 1),
+        tx('a', 7, 1),
+        tx('a', 'a', 1),
+        'not a transaction',
+    ])
+
+    assert accepted == []
+    assert [reason for _, reason in rejected] == [
+        'Missing values', 'Invalid sender', 'Invalid recipient',
+        'Sender equals recipient', 'Not an object',
+    ]
+
+
+def test_reward_only_allowed_at_assembly():
+    node = Blockchain()
+    reward = tx(REWARD_SENDER, 'miner', 1)
+
+    assert node.validate_transactions([reward])[0] == []
+    assert node.validate_transactions([reward], allow_reward=True)[0] == [reward]
+
+
+def test_overdraft_rejects_only_transactions_over_balance():
+    node = Blockchain()
+    node.balances['a'] = 5
+
+    accepted, rejected = node.validate_transactions([
+        tx('a', 'b', 3), tx('a', 'c', 3), tx('a', 'd', 2), tx('nobody', 'b', 1),
+    ])
+
+    assert accepted == [tx('a', 'b', 3), tx('a', 'd', 2)]
+    assert [(t['recipient'], reason) for t, reason in rejected] == [
+        ('c', 'Insufficient funds'), ('b', 'Insufficient funds'),
+    ]
+
+
+def test_overdraft_counts_pending_transactions():
+    node = Blockchain()
+    node.balances['a'] = 5
+
+    index, rejected = node.add_transactions([tx('a', 'b', 4)])
+    assert index == 2 and rejected == []
+
+    _, rejected = node.add_transactions([tx('a', 'c', 2)])
+    assert rejected == [(tx('a', 'c', 2), 'Insufficient funds')]
+    assert node.current_transactions == [tx('a', 'b', 4)]
+
+
+def test_duplicates_rejected_in_batch_and_against_mempool():
+    node = Blockchain()
+    node.balances['a'] = 10
+    node.add_transactions([tx('a', 'b', 1)])
+
+    _, rejected = node.add_transactions([tx('a', 'b', 1), tx('a', 'c', 1), tx('a', 'c', 1)])
+
+    assert [(t['recipient'], reason) for t, reason in rejected] == [
+        ('b', 'Duplicate transaction'), ('c', 'Duplicate transaction'),
+    ]
+    assert node.current_transactions == [tx('a', 'b', 1), tx('a', 'c', 1)]
+
+
+def test_revalidate_mempool_drops_overdrafts():
+    node = Blockchain()
+    node.balances['a'] = 5
+    node.add_transactions([tx('a', 'b', 3), tx('a', 'c', 2)])
+    node.balances['a'] = 3
+
+    rejected = node.revalidate_mempool()
+
+    assert node.current_transactions == [tx('a', 'b', 3)]
+    assert rejected == [(tx('a', 'c', 2), 'Insufficient funds')]
+
+
+# Снимки и журнал
+
+_proofs = {}
+
+
+def mine(node, count, recipient='miner'):
+    for _ in range(count):
+        last_proof = node.chain[-1]['proof']
+        if last_proof not in _proofs:
+            _proofs[last_proof] = node.proof_of_work(last_proof)
+        node.new_transaction(REWARD_SENDER, recipient, 1)
+        node.new_block(_proofs[last_proof])
+
+
+def restart(storage, **kwargs):
+    node = Blockchain()
+    replayed = node.open_storage(str(storage), **kwargs)
+    return node, replayed
+
+
+def test_restart_from_snapshot_replays_only_journal_tail(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=3)
+    mine(node, 7)
+    node.wait_snapshot()
+
+    assert sorted(p.name for p in tmp_path.glob('snapshot-*.json')) == [
+        'snapshot-000000000003.json', 'snapshot-000000000006.json',
+    ]
+
+    restored, replayed = restart(tmp_path, snapshot_interval=3)
+
+    # Снимок на высоте 6, из журнала доигрываются только блоки 7 и 8
+    assert replayed == 2
+    assert restored.chain == node.chain
+    assert restored.block_hashes == node.block_hashes
+    assert restored.balances == {'miner': 7}
+
+
+def test_restart_without_snapshot_replays_whole_journal(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 3)
+
+    restored, replayed = restart(tmp_path, snapshot_interval=0)
+
+    assert replayed == 4
+    assert restored.block_hashes == node.block_hashes
+
+
+def test_partial_journal_line_is_cut_on_restart(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 2)
+    journal = tmp_path / 'journal.jsonl'
+    good_size = journal.stat().st_size
+    with open(journal, 'a') as fw:
+        fw.write('{"index": 4, "transac')
+
+    restored, _ = restart(tmp_path, snapshot_interval=0)
+
+    assert restored.block_hashes == node.block_hashes
+    assert journal.stat().st_size == good_size
+
+    # Следующий блок дописывается за последней целой записью
+    mine(restored, 1)
+    again, _ = restart(tmp_path, snapshot_interval=0)
+    assert again.block_hashes == restored.block_hashes
+
+
+def test_failed_snapshot_verification_marks_node_unhealthy(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 3)
+    node.save_snapshot()
+
+    # Подменяем сумму в снимке, не трогая индексы
+    path = next(tmp_path.glob('snapshot-*.json'))
+    path.write_text(path.read_text().replace('"amount": 1', '"amount": 2', 1))
+
+    restored, _ = restart(tmp_path, snapshot_interval=0)
+    assert restored._verify_snapshot(len(restored.chain), dict(restored.balances)) is False
+    assert not restored.healthy
+    assert list(tmp_path.glob('snapshot-*.json')) == []
+    assert restored.save_snapshot() is None
+
+    # Без снимка цепь доигрывается из журнала с генезиса
+    clean, replayed = restart(tmp_path, snapshot_interval=0)
+    assert replayed == 4
+    assert clean.block_hashes == node.block_hashes
+
+
+def test_snapshot_verification_rebuilds_balances(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 3)
+    path = node.save_snapshot()
+
+    with open(path) as fr:
+        snapshot = json.load(fr)
+    snapshot['balances']['attacker'] = 10 ** 6
+    with open(path, 'w') as fw:
+        json.dump(snapshot, fw)
+
+    restored, _ = restart(tmp_path, snapshot_interval=0)
+    assert restored._verify_snapshot(len(restored.chain), snapshot['balances']) is False
+    assert not restored.healthy
+
+
+@pytest.mark.parametrize('field', ['proof', 'transactions'])
+def test_snapshot_verification_fails_on_malformed_block(tmp_path, field):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 3)
+
+    # Индекс хешей согласован с поврежденным блоком
+    del node.chain[2][field]
+    node.block_hashes[2] = Blockchain.hash(node.chain[2])
+
+    assert node._verify_snapshot(len(node.chain), dict(node.balances)) is False
+    assert not node.healthy
+
+
+def fork(length, recipient='other'):
+    node = Blockchain()
+    mine(node, length - 1, recipient)
+    return node.chain
+
+
+class SnapshotInProgress(object):
+    """Держит фоновую запись снимка занятой, чтобы новые снимки пропускались."""
+    def __init__(self, node):
+        self.release = threading.Event()
+        node._snapshot_thread = threading.Thread(target=self.release.wait, daemon=True)
+        node._snapshot_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release.set()
+
+
+def test_restart_after_replace_with_shorter_chain(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 5)
+    node.save_snapshot()
+
+    node.replace_chain(node.chain[:3])
+    node.wait_snapshot()
+    size = (tmp_path / 'journal.jsonl').stat().st_size
+
+    restored, _ = restart(tmp_path, snapshot_interval=0)
+
+    assert restored.block_hashes == node.block_hashes
+    assert (tmp_path / 'journal.jsonl').stat().st_size == size
+
+
+def test_restart_after_replace_while_snapshot_in_progress(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 5)
+    node.save_snapshot()
+    longer = fork(10)
+
+    with SnapshotInProgress(node):
+        node.replace_chain(longer)
+    size = (tmp_path / 'journal.jsonl').stat().st_size
+
+    restored, _ = restart(tmp_path, snapshot_interval=0)
+
+    assert restored.block_hashes == node.block_hashes
+    assert restored.balances == {'other': 9}
+    assert (tmp_path / 'journal.jsonl').stat().st_size == size
+
+
+def test_snapshot_from_other_journal_is_ignored(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 5)
+    journal = tmp_path / 'journal.jsonl'
+
+    for replacement in (node.chain[:3], fork(10)):
+        stale = pathlib.Path(node.save_snapshot())
+        text = stale.read_text()
+        node.replace_chain(replacement)
+        node.wait_snapshot()
+
+        # Снимок, переживший замену цепи: позиция в журнале указывает
+        # за конец нового журнала или в чужую запись
+        for path in tmp_path.glob('snapshot-*.json'):
+            path.unlink()
+        stale.write_text(text)
+        size = journal.stat().st_size
+
+        restored, replayed = restart(tmp_path, snapshot_interval=0)
+
+        assert replayed == len(replacement)
+        assert restored.block_hashes == node.block_hashes
+        assert journal.stat().st_size == size
+        assert list(tmp_path.glob('snapshot-*.json')) == []
+
+
+# Обрезка и архив
+
+def restart_pruned(tmp_path, depth=2, segment_size=3, **kwargs):
+    node = Blockchain()
+    if depth:
+        node.enable_pruning(str(tmp_path / 'archive'), depth, segment_size)
+    replayed = node.open_storage(str(tmp_path / 'storage'), **kwargs)
+    return node, replayed
+
+
+def test_pruned_bodies_are_archived_and_loaded_back(tmp_path):
+    node, _ = restart_pruned(tmp_path, snapshot_interval=0)
+    mine(node, 8)
+    full = [Blockchain.hash(block) for block in node.export_chain()]
+
+    assert node.archived_height == 6
+    assert all('transactions' not in block for block in node.chain[:6])
+    assert full == node.block_hashes
+    assert node.get_block(2)['transactions'] == [tx(REWARD_SENDER, 'miner', 1)]
+
+
+def test_restart_with_changed_segment_size_uses_archive_manifest(tmp_path):
+    node, _ = restart_pruned(tmp_path, segment_size=3, snapshot_interval=0)
+    mine(node, 8)
+    node.save_snapshot()
+
+    restored, _ = restart_pruned(tmp_path, segment_size=4, snapshot_interval=0)
+
+    assert restored.segment_size == 3
+    assert restored.archived_height == 6
+    assert [Blockchain.hash(block) for block in restored.export_chain()] == node.block_hashes
+
+
+def test_restart_with_pruning_off_refuses_pruned_snapshot(tmp_path):
+    node, _ = restart_pruned(tmp_path, snapshot_interval=0)
+    mine(node, 8)
+    node.save_snapshot()
+
+    with pytest.raises(RuntimeError):
+        restart_pruned(tmp_path, depth=0, snapshot_interval=0)
+
+
+def test_restart_with_other_archive_refuses_pruned_snapshot(tmp_path):
+    node, _ = restart_pruned(tmp_path, segment_size=3, snapshot_interval=0)
+    mine(node, 8)
+    node.save_snapshot()
+    (tmp_path / 'archive').rename(tmp_path / 'archive-old')
+
+    with pytest.raises(RuntimeError):
+        restart_pruned(tmp_path, segment_size=4, snapshot_interval=0)
+
+
+@pytest.mark.parametrize('snapshot_busy', [False, True])
+def test_pruned_restart_after_replace(tmp_path, snapshot_busy):
+    node, _ = restart_pruned(tmp_path, snapshot_interval=0)
+    mine(node, 8)
+    node.save_snapshot()
+    longer = fork(10)
+
+    with SnapshotInProgress(node) if snapshot_busy else contextlib.nullcontext():
+        node.replace_chain(longer)
+    node.wait_snapshot()
+
+    restored, _ = restart_pruned(tmp_path, snapshot_interval=0)
+
+    assert restored.archived_height == 6
+    assert [Blockchain.hash(block) for block in restored.export_chain()] == node.block_hashes
+    assert restored.balances == {'other': 9}
+
+
+# Офлайн-утилиты
+
+def test_readonly_load_does_not_touch_storage(tmp_path):
+    node, _ = restart(tmp_path, snapshot_interval=0)
+    mine(node, 2)
+    journal = tmp_path / 'journal.jsonl'
+    with open(journal, 'a') as fw:
+        fw.write('{"index": 4, "transac')
+    size = journal.stat().st_size
+    files = sorted(p.name for p in tmp_path.iterdir())
+
+    reader = Blockchain()
+    reader.open_storage(str(tmp_path), snapshot_interval=0, readonly=True)
+    mine(reader, 1)
+    reader.replace_chain(reader.chain[:2])
+
+    assert journal.stat().st_size == size
+    assert sorted(p.name for p in tmp_path.iterdir()) == files
+
+
+def test_readonly_load_without_journal_creates_nothing(tmp_path):
+    reader = Blockchain()
+    reader.open_storage(str(tmp_path), readonly=True)
+
+    assert len(reader.chain) == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_reads_pruned_storage(tmp_path, capsys):
+    node, _ = restart_pruned(tmp_path, snapshot_interval=0)
+    mine(node, 8)
+    node.save_snapshot()
+    archive = sorted(p.name for p in (tmp_path / 'archive').iterdir())
+    output = tmp_path / 'export.json'
+
+    assert mhchain.main([
+        'export', str(tmp_path / 'storage'),
+        '--archive-dir', str(tmp_path / 'archive'), '-o', str(output),
+    ]) == 0
+    assert [Blockchain.hash(block) for block in json.loads(output.read_text())] == node.block_hashes
+    assert sorted(p.name for p in (tmp_path / 'archive').iterdir()) == archive
+
+    assert mhchain.main(['export', str(tmp_path / 'storage')]) == 2
+    assert 'обрезки' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('chain', [
+    [1, 2],
+    [{'index': 1, 'transactions': ['x']}],
+    [{'index': 1, 'transactions': {'sender': 'a'}}],
+])
+def test_malformed_chain_file_is_reported(tmp_path, capsys, chain):
+    path = tmp_path / 'chain.json'
+    path.write_text(json.dumps(chain))
+
+    assert mhchain.main(['stats', str(path)]) == 2
+    assert 'ValueError' in capsys.readouterr().err
+    assert mhchain.main(['validate', str(path)]) == 1
+    assert 'FAIL' in capsys.readouterr().out